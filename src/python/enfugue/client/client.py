@@ -308,3 +308,18 @@ class EnfugueClient(UserExtensionClientBase, JSONWebServiceAPIClient):
             else:
                 raise
         return RemoteInvocation.from_response(self, response.get("data", {}))
+
+    def invoke_batch(self, invocations: List[Dict[str, Any]]) -> List[RemoteInvocation]:
+        """
+        Invokes the engine with multiple sets of arguments in a single request.
+
+        Queueing the invocations together lets the server re-use the loaded
+        pipeline across entries that share a model. Servers without the batch
+        endpoint will error; callers should fall back to invoke().
+        """
+        logger.info(f"Invoking batch of {len(invocations)}")
+        response = self.post("/invoke/batch", data=invocations).json()
+        return [
+            RemoteInvocation.from_response(self, datum)
+            for datum in response.get("data", [])
+        ]
@@ -1,42 +1,142 @@
 """
 Runs an end-to-end test of an active installation.
 """
+import gc
 import os
 import re
+import math
+import hashlib
+import functools
+import textwrap
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from pibble.util.log import DebugUnifiedLoggingContext
 
 from enfugue.diffusion.constants import DEFAULT_SDXL_MODEL, DEFAULT_SDXL_REFINER
 from enfugue.client import EnfugueClient
+from enfugue.client.invocation import RemoteInvocation
 from enfugue.util import logger, fit_image, image_from_uri
 from PIL import Image, ImageDraw, ImageFont
-from collections import OrderedDict
-from typing import Any, List
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 GRID_SIZE = 256
 GRID_COLS = 4
 CAPTION_HEIGHT = 50
+MAX_WORKERS = 8
 CHECKPOINT = "epicphotogasm_zUniversal.safetensors"
 CHECKPOINT_URL = "https://civitai.com/api/download/models/201259"
 INPAINT_IMAGE = "https://huggingface.co/datasets/diffusers/test-arrays/resolve/main/stable_diffusion_inpaint/boy.png"
 INPAINT_MASK = "https://huggingface.co/datasets/diffusers/test-arrays/resolve/main/stable_diffusion_inpaint/boy_mask.png"
+MODEL_ORDER = [
+    CHECKPOINT,
+    DEFAULT_SDXL_MODEL,
+    f"{DEFAULT_SDXL_MODEL}+{DEFAULT_SDXL_REFINER}"
+]
+SAVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test-results", "e2e")
+# Matches saved result filenames as written by save_results
+_RESULT_RE = re.compile(r"^(?P<name>.+)-(?P<idx>\d+)\.png$")
+FONT = ImageFont.load_default()
+# Measured once; multiline_text takes the gap between lines, not the line height
+LINE_SPACING = max(2, FONT.getbbox("Ay")[3] // 4)
+
+# PNG encoding is CPU-bound zlib work; writing on background threads keeps
+# the scheduler free to dispatch the next invocation, and since Pillow
+# releases the GIL during DEFLATE the encodes genuinely run in parallel
+# across cores. Level 1 compression is ~5x faster than the default for a
+# negligible size increase.
+_writer = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+# Checked after the writer drains; submit() alone would swallow save errors
+_writer_futures: List[Future] = []
+
+def _thumbnail_path(name: str, index: int) -> str:
+    """
+    Gets the path of the cached grid-sized thumbnail for a result.
+    """
+    return os.path.join(SAVE_DIR, "_thumb", f"{name}-{index}.png")
+
+def _save_result(name: str, index: int, result: Image.Image, path: str, close: bool = False) -> None:
+    """
+    Encodes and writes a single result PNG on the background writer,
+    along with a palette-quantized grid-sized thumbnail so the grid
+    build never has to decode or resize the full-resolution image.
+
+    Dimensions that are integer multiples of the grid size take the
+    reduction fast path in Image.thumbnail (further accelerated by the
+    Pillow-SIMD wheel when installed); others fall back to fit_image.
+    """
+    result.save(path, compress_level=1)
+    if result.width % GRID_SIZE == 0 and result.height % GRID_SIZE == 0:
+        thumbnail = result.copy()
+        thumbnail.thumbnail((GRID_SIZE, GRID_SIZE), Image.BOX)
+        if thumbnail.size != (GRID_SIZE, GRID_SIZE):
+            # Black letterbox, matching what fit_image's contain canvas
+            # flattens to in the fallback path
+            padded = Image.new("RGB", (GRID_SIZE, GRID_SIZE), (0, 0, 0))
+            padded.paste(
+                thumbnail,
+                ((GRID_SIZE - thumbnail.width) // 2, (GRID_SIZE - thumbnail.height) // 2)
+            )
+            thumbnail = padded
+    else:
+        thumbnail = fit_image(result, GRID_SIZE, GRID_SIZE, "contain", "center-center")
+    thumbnail = thumbnail.convert("P", palette=Image.ADAPTIVE, colors=256)
+    thumbnail_path = _thumbnail_path(name, index)
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+    thumbnail.save(thumbnail_path, compress_level=1)
+    if close:
+        result.close()
+    logger.info(f"Saved result for \"{name}\" sample {index+1} to {path}")
+
+@functools.lru_cache(maxsize=None)
+def _cached_image(uri: str) -> Image.Image:
+    """
+    Fetches an image by URI, caching it on disk so repeated runs skip the network.
+    """
+    cache_path = os.path.join(SAVE_DIR, "_cache", f"{hashlib.sha1(uri.encode()).hexdigest()}.png")
+    if os.path.exists(cache_path):
+        image = Image.open(cache_path)
+    else:
+        image = image_from_uri(uri)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        image.save(cache_path, "PNG", optimize=False)
+    # Load before returning; lazy images are not safe to share across
+    # the pool workers that consume them
+    image.load()
+    return image
 
 def split_text(text: str, maxlen: int = 40) -> str:
     """
     Splits text into lines based on max length.
     """
-    lines = 1 + len(text) // maxlen
-    return "\n".join([
-        text[(i*maxlen):((i+1)*maxlen)]
-        for i in range(lines)
-    ])
+    return "\n".join(textwrap.wrap(
+        text,
+        maxlen,
+        drop_whitespace=False,
+        break_on_hyphens=False,
+        break_long_words=True
+    )) or text
 
 def main() -> None:
-    font = ImageFont.load_default()
     with DebugUnifiedLoggingContext():
-        save_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test-results", "e2e")
+        save_dir = SAVE_DIR
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
+        # Index existing results once; one directory scan and one compiled
+        # pattern instead of a rescan and rebuilt regex per invocation.
+        # Entries are ordered by sample index, not listdir order, so the
+        # skip path lines results up with their thumbnails and captions
+        indexed: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        for filename in os.listdir(save_dir):
+            match = _RESULT_RE.match(filename)
+            if match:
+                indexed[match.group("name")].append((int(match.group("idx")), filename))
+        existing_files: Dict[str, List[str]] = {
+            name: [filename for _, filename in sorted(entries)]
+            for name, entries in indexed.items()
+        }
 
         client = EnfugueClient()
         # Override client variables with ENFUGUE_CLIENT_HOST, ENFUGUE_CLIENT_PORT, etc. env vars
@@ -52,33 +152,59 @@ def main() -> None:
             }
         )
 
-        all_results = OrderedDict()
+        # Prefetch independent I/O concurrently; results are claimed
+        # just-in-time before their first use below.
+        prefetch = ThreadPoolExecutor(max_workers=3)
+        inpaint_image_future = prefetch.submit(_cached_image, INPAINT_IMAGE)
+        inpaint_mask_future = prefetch.submit(_cached_image, INPAINT_MASK)
 
-        def save_results(name: str, results: List[Image.Image]) -> List[Image.Image]:
-            nonlocal all_results
+        # Maps result names to their paths on disk; the grid build re-opens
+        # them lazily so peak memory stays at one tile rather than the whole
+        # run's output
+        all_results: Dict[str, List[str]] = {}
+        results_lock = threading.Lock()
+
+        def save_results(name: str, results: List[Image.Image], keep: bool = False) -> List[Image.Image]:
+            result_paths = []
             for i, result in enumerate(results):
                 result_path = os.path.join(save_dir, f"{name}-{i}.png")
-                result.save(result_path)
-                logger.info(f"Saved result for \"{name}\" sample {i+1} to {result_path}")
-            all_results[name] = results
+                # Images nothing downstream consumes are closed by the
+                # writer once encoded
+                _writer_futures.append(
+                    _writer.submit(_save_result, name, i, result, result_path, not keep)
+                )
+                result_paths.append(result_path)
+            with results_lock:
+                all_results[name] = result_paths
             return results
 
-        def invoke(name: str, **kwargs: Any) -> List[Image.Image]:
-            existing_results = [
-                filename for filename 
-                in os.listdir(save_dir) 
-                if re.match(f"^{name}\-\d+\..*$", filename)
+        def find_cached(name: str) -> Optional[List[Union[str, Image.Image]]]:
+            existing_results = existing_files.get(name, [])
+            if not existing_results:
+                return None
+            # Store paths and defer decoding to the grid build; only results
+            # that downstream jobs consume are opened here
+            result_paths = [
+                os.path.join(save_dir, result)
+                for result in existing_results
             ]
-            if existing_results:
-                results = [
-                    Image.open(os.path.join(save_dir, result))
-                    for result in existing_results
-                ]
-                logger.info(f"Found existing results {existing_results}, skipping test {name}")
-                nonlocal all_results
-                all_results[name] = results
-                return results
-            results = []
+            results: List[Union[str, Image.Image]] = result_paths
+            if name in depended_names:
+                # Load eagerly; dependent jobs consume these images from
+                # multiple pool workers and a lazy first read is not
+                # thread-safe
+                opened = []
+                for path in result_paths:
+                    image = Image.open(path)
+                    image.load()
+                    opened.append(image)
+                results = opened
+            logger.info(f"Found existing results {existing_results}, skipping test {name}")
+            with results_lock:
+                all_results[name] = result_paths
+            return results
+
+        def prepare(name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
             if "seed" not in kwargs:
                 # Two seeds for controlled/non-controlled:
                 # Controlnet doesn't change enough if it uses the same
@@ -88,57 +214,125 @@ def main() -> None:
                 kwargs["model"] = CHECKPOINT
             kwargs["intermediates"] = False
             kwargs["num_inference_steps"] = 25
+            return kwargs
+
+        def submit(name: str, kwargs: Dict[str, Any]) -> RemoteInvocation:
+            kwargs = prepare(name, kwargs)
             logger.info(f"Testing {name}\n{kwargs}")
-            result = client.invoke(**kwargs)
+            return client.invoke(**kwargs)
+
+        def collect(name: str, invocation: RemoteInvocation, samples: int = 1, keep: bool = False) -> List[Image.Image]:
             try:
-                images = result.results()
+                images = invocation.results()
+                # Load before publishing; the writer thread and any
+                # dependent jobs read these concurrently
+                for image in images:
+                    image.load()
             except Exception as ex:
                 logger.error(f"Error in invocation {name}: {type(ex).__name__}({ex})")
                 image = Image.new("RGB", (GRID_SIZE, GRID_SIZE), (255,255,255))
                 draw = ImageDraw.Draw(image)
-                draw.text(
+                draw.multiline_text(
                     (5, 5),
                     split_text(str(ex)),
                     fill=(0,0,0),
-                    font=font
+                    font=FONT,
+                    spacing=LINE_SPACING
                 )
-                images = [image] * kwargs.get("samples", 1)
+                # Copies rather than repeated references, since the writer
+                # closes each sample it is handed independently
+                images = [image.copy() for sample in range(samples)]
+                image.close()
                 name = f"{name} ({type(ex).__name__})"
-            result.delete()
-            return save_results(name, images)
+            invocation.delete()
+            return save_results(name, images, keep)
+
+        supports_batch = True
+        batch_lock = threading.Lock()
+
+        def invoke_group(group: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, List[Union[str, Image.Image]]]:
+            """
+            Invokes a group of same-model jobs, batching server-side when possible.
+            """
+            nonlocal supports_batch
+            grouped: Dict[str, List[Union[str, Image.Image]]] = {}
+            live: List[Tuple[str, Dict[str, Any]]] = []
+            for name, kwargs in group:
+                cached = find_cached(name)
+                if cached is not None:
+                    grouped[name] = cached
+                else:
+                    live.append((name, prepare(name, kwargs)))
+            invocations = None
+            if len(live) > 1:
+                # Only the batch POST itself decides support; errors while
+                # collecting a successfully submitted batch must propagate
+                # rather than re-invoking already-run jobs sequentially.
+                # Posting under the lock settles the flag exactly once
+                # instead of every first-wave chunk probing the endpoint
+                with batch_lock:
+                    if supports_batch:
+                        try:
+                            invocations = client.invoke_batch([kwargs for name, kwargs in live])
+                        except Exception as ex:
+                            logger.warning(f"Batch invocation unsupported ({type(ex).__name__}({ex})), falling back to sequential")
+                            supports_batch = False
+            if invocations is not None:
+                if len(invocations) != len(live):
+                    # A short response would silently drop jobs and
+                    # deadlock their dependents in the scheduler
+                    raise RuntimeError(
+                        f"Batch invocation returned {len(invocations)} invocations for {len(live)} jobs"
+                    )
+                for (name, kwargs), invocation in zip(live, invocations):
+                    grouped[name] = collect(name, invocation, kwargs.get("samples", 1), name in depended_names)
+                return grouped
+            for name, kwargs in live:
+                grouped[name] = collect(name, submit(name, kwargs), kwargs.get("samples", 1), name in depended_names)
+            return grouped
 
         gpu_name = "Unknown GPU"
         status = client.status()
         if "gpu" in status and isinstance(status["gpu"], dict):
             gpu = status["gpu"]
             gpu_name = gpu.get("name", gpu_name)
-        
+
         logger.info(f"Starting e2e test on {gpu_name}")
         checkpoints = client.checkpoints()
+        download_future = None
         if CHECKPOINT not in [checkpoint["name"] for checkpoint in checkpoints]:
             logger.info(f"Downloading checkpoint {CHECKPOINT}")
-            client.download("checkpoint", CHECKPOINT_URL, filename=CHECKPOINT)
-        
-        # Base txt2img
+            download_future = prefetch.submit(client.download, "checkpoint", CHECKPOINT_URL, filename=CHECKPOINT)
+
+        inpaint_image = inpaint_image_future.result()
+        inpaint_mask = inpaint_mask_future.result()
+
         prompt = "A man and woman standing outside a house, happy couple purchasing their first home, wearing casual clothing"
-        base = invoke("txt2img", prompt=prompt)[0]
-        
+
+        # Declare every invocation up-front as (name, predecessors, kwargs factory).
+        # Factories receive the result lists of their predecessors in declaration
+        # order, so independent jobs can be dispatched as soon as their
+        # predecessors resolve rather than strictly sequentially.
+        jobs: List[Tuple[str, List[str], Callable[..., Dict[str, Any]]]] = []
+
+        def add_job(name: str, depends: List[str], make_kwargs: Callable[..., Dict[str, Any]]) -> None:
+            jobs.append((name, depends, make_kwargs))
+
+        # Base txt2img
+        add_job("txt2img", [], lambda: dict(prompt=prompt))
+
         # Base img2img
-        invoke(
-            "img2img",
+        add_job("img2img", ["txt2img"], lambda txt2img: dict(
             prompt=prompt,
             layers=[{
-                "image": base,
+                "image": txt2img[0],
                 "visibility": "denoised",
             }],
             strength=0.8
-        )
-        
+        ))
+
         # Base inpaint + fit
-        inpaint_image = image_from_uri(INPAINT_IMAGE)
-        inpaint_mask = image_from_uri(INPAINT_MASK)
-        invoke(
-            "inpaint", 
+        add_job("inpaint", [], lambda: dict(
             prompt="a handsome man with ray-ban sunglasses",
             mask=inpaint_mask,
             layers=[{
@@ -148,10 +342,9 @@ def main() -> None:
             }],
             width=512,
             height=512,
-        )
+        ))
 
-        invoke(
-            "inpaint-4ch",
+        add_job("inpaint-4ch", [], lambda: dict(
             inpainter=CHECKPOINT,
             prompt="a handsome man with ray-ban sunglasses",
             mask=inpaint_mask,
@@ -162,14 +355,13 @@ def main() -> None:
             }],
             width=512,
             height=512,
-        )
+        ))
 
         # Automatic background removal with no inference
-        width, height = inpaint_image.size
-        invoke(
-            "background", 
-            width=width,
-            height=height,
+        inpaint_width, inpaint_height = inpaint_image.size
+        add_job("background", [], lambda: dict(
+            width=inpaint_width,
+            height=inpaint_height,
             layers=[{
                 "image": inpaint_image,
                 "fit": "cover",
@@ -177,11 +369,10 @@ def main() -> None:
                 "visibility": "visible"
             }],
             outpaint=False
-        )
+        ))
 
         # Automatic background removal with outpaint
-        invoke(
-            "background-fill",
+        add_job("background-fill", [], lambda: dict(
             prompt="a handsome man outside on a sunny day, green forest in the distance",
             layers=[{
                 "image": inpaint_image,
@@ -190,39 +381,35 @@ def main() -> None:
                 "visibility": "visible"
             }],
             outpaint=True
-        )
+        ))
 
         # IP Adapter
-        invoke(
-            "ip-adapter",
+        add_job("ip-adapter", [], lambda: dict(
             prompt="a handsome man",
             layers=[{
                 "image": inpaint_image,
                 "ip_adapter_scale": 1.0
             }]
-        )
-        invoke(
-            "ip-adapter-plus",
+        ))
+        add_job("ip-adapter-plus", [], lambda: dict(
             ip_adapter_model="plus",
             prompt="a handsome man",
             layers=[{
                 "image": inpaint_image,
                 "ip_adapter_scale": 1.0
             }]
-        )
-        invoke(
-            "ip-adapter-plus-face",
+        ))
+        add_job("ip-adapter-plus-face", [], lambda: dict(
             ip_adapter_model="plus-face",
             prompt="a handsome man",
             layers=[{
                 "image": inpaint_image,
                 "ip_adapter_scale": 1.0
             }]
-        )
-        
+        ))
+
         # Sizing, fitting and outpaint
-        invoke(
-            "outpaint", 
+        add_job("outpaint", [], lambda: dict(
             prompt="a handsome man walking outside on a boardwalk, distant house, foggy weather, dark clouds overhead",
             negative_prompt="frame, framing, comic book paneling, multiple images, awning, roof, shelter, trellice",
             layers=[
@@ -237,91 +424,83 @@ def main() -> None:
             ],
             strength=1.0,
             outpaint=True
-        )
+        ))
 
         # Controlnets
         for controlnet in ["canny", "hed", "pidi", "scribble", "depth", "normal", "mlsd", "line", "anime", "pose"]:
-            invoke(
-                f"txt2img-controlnet-{controlnet}",
+            add_job(f"txt2img-controlnet-{controlnet}", ["txt2img"], lambda txt2img, controlnet=controlnet: dict(
                 prompt=prompt,
                 layers=[{
                     "control_units": [{
                         "controlnet": controlnet,
                     }],
-                    "image": base,
+                    "image": txt2img[0],
                 }]
-            )
-            
-            invoke(
-                f"img2img-controlnet-{controlnet}",
+            ))
+
+            add_job(f"img2img-controlnet-{controlnet}", ["txt2img"], lambda txt2img, controlnet=controlnet: dict(
                 prompt=prompt,
                 strength=0.8,
                 layers=[{
                     "control_units": [{
                         "controlnet": controlnet,
                     }],
-                    "image": base,
+                    "image": txt2img[0],
                     "visibility": "denoised"
                 }]
-            )
-            
-            invoke(
-                f"img2img-ip-controlnet-{controlnet}",
+            ))
+
+            add_job(f"img2img-ip-controlnet-{controlnet}", ["txt2img"], lambda txt2img, controlnet=controlnet: dict(
                 prompt=prompt,
                 strength=0.8,
                 layers=[{
                     "control_units": [{
                         "controlnet": controlnet,
                     }],
-                    "image": base,
+                    "image": txt2img[0],
                     "visibility": "denoised",
                     "ip_adapter_scale": 0.5
                 }]
-            )
-        
+            ))
+
         # Schedulers
         for scheduler in ["ddim", "ddpm", "deis", "dpmsm", "dpmss", "dpmsmk", "dpmsmka", "heun", "dpmd", "adpmd", "dpmsde", "unipc", "lmsd", "pndm", "eds", "eads"]:
-            invoke(
-                f"txt2img-scheduler-{scheduler}",
+            add_job(f"txt2img-scheduler-{scheduler}", [], lambda scheduler=scheduler: dict(
                 prompt=prompt,
                 scheduler=scheduler
-            )
+            ))
             if scheduler != "dpmsde":
-                invoke(
-                    f"txt2img-multi-scheduler-{scheduler}",
+                add_job(f"txt2img-multi-scheduler-{scheduler}", [], lambda scheduler=scheduler: dict(
                     prompt=prompt,
                     scheduler=scheduler,
                     height=768,
                     width=786,
                     tiling_stride=256,
-                )
+                ))
 
         # Upscalers
-        invoke(
-            f"upscale-standalone-esrgan",
+        add_job("upscale-standalone-esrgan", ["txt2img"], lambda txt2img: dict(
             upscale=[{
                 "amount": 2,
                 "method": "esrgan"
             }],
             layers=[{
-                "image": base,
+                "image": txt2img[0],
                 "visibility": "visible"
             }]
-        )
-        invoke(
-            f"upscale-standalone-gfpgan",
+        ))
+        add_job("upscale-standalone-gfpgan", ["txt2img"], lambda txt2img: dict(
             upscale=[{
                 "amount": 2,
                 "method": "gfpgan"
             }],
             layers=[{
-                "image": base,
+                "image": txt2img[0],
                 "visibility": "visible"
             }]
-        )
+        ))
 
-        invoke(
-            f"upscale-iterative-diffusion",
+        add_job("upscale-iterative-diffusion", [], lambda: dict(
             prompt="A green tree frog",
             upscale=[
                 {
@@ -341,19 +520,17 @@ def main() -> None:
                     "guidance_scale": 8
                 }
             ]
-        )
+        ))
 
         # SDXL
         if os.getenv("TEST_SDXL", "0").lower()[0] in ["1", "y", "t"]:
-            invoke(
-                "sdxl",
+            add_job("sdxl", [], lambda: dict(
                 model=DEFAULT_SDXL_MODEL,
                 prompt="A bride and groom on their wedding day",
                 guidance_scale=6
-            )
+            ))
 
-            invoke(
-                "sdxl-inpaint",
+            add_job("sdxl-inpaint", [], lambda: dict(
                 prompt="a handsome man with ray-ban sunglasses",
                 model=DEFAULT_SDXL_MODEL,
                 mask=fit_image(inpaint_mask, width=1024, height=1024, fit="stretch"),
@@ -363,10 +540,9 @@ def main() -> None:
                     "image": fit_image(inpaint_image, width=1024, height=1024, fit="stretch"),
                     "visibility": "visible"
                 }]
-            )
+            ))
 
-            invoke(
-                "sdxl-inpaint-4ch",
+            add_job("sdxl-inpaint-4ch", [], lambda: dict(
                 prompt="a handsome man with ray-ban sunglasses",
                 inpainter=DEFAULT_SDXL_MODEL,
                 mask=fit_image(inpaint_mask, width=1024, height=1024, fit="stretch"),
@@ -374,37 +550,34 @@ def main() -> None:
                 height=1024,
                 layers=[{
                     "image": fit_image(inpaint_image, width=1024, height=1024, fit="stretch"),
-                "visibility": "visible"
+                    "visibility": "visible"
                 }]
-            )
+            ))
 
-            control = invoke(
-                "sdxl-refined",
+            add_job("sdxl-refined", [], lambda: dict(
                 model=DEFAULT_SDXL_MODEL,
                 refiner=DEFAULT_SDXL_REFINER,
                 prompt="A bride and groom on their wedding day",
                 refiner_start=0.85,
                 guidance_scale=6
-            )[0]
-            
+            ))
+
             # SDXL ControlNet
             for controlnet in ["canny", "depth", ]:
-                invoke(
-                    f"sdxl-{controlnet}-txt2img",
+                add_job(f"sdxl-{controlnet}-txt2img", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     layers=[{
                         "control_units": [{
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                     }],
                     prompt="A bride and groom on their wedding day",
                     guidance_scale=6
-                )[0]
+                ))
 
-                invoke(
-                    f"sdxl-{controlnet}-txt2img-refined",
+                add_job(f"sdxl-{controlnet}-txt2img-refined", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     refiner=DEFAULT_SDXL_REFINER,
                     layers=[{
@@ -412,15 +585,14 @@ def main() -> None:
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                     }],
                     prompt="A bride and groom on their wedding day",
                     refiner_start=0.85,
                     guidance_scale=6
-                )[0]
-                
-                invoke(
-                    f"sdxl-{controlnet}-img2img",
+                ))
+
+                add_job(f"sdxl-{controlnet}-img2img", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     strength=0.8,
                     layers=[{
@@ -428,15 +600,14 @@ def main() -> None:
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                         "visibility": "denoised",
                     }],
                     prompt="A bride and groom on their wedding day",
                     guidance_scale=6
-                )[0]
-                
-                invoke(
-                    f"sdxl-{controlnet}-img2img-refined",
+                ))
+
+                add_job(f"sdxl-{controlnet}-img2img-refined", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     refiner=DEFAULT_SDXL_REFINER,
                     layers=[{
@@ -444,17 +615,16 @@ def main() -> None:
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                         "visibility": "denoised",
                     }],
                     strength=0.8,
                     refiner_start=0.85,
                     prompt="A bride and groom on their wedding day",
                     guidance_scale=6
-                )[0]
-               
-                invoke(
-                    f"sdxl-{controlnet}-img2img-ip-refined",
+                ))
+
+                add_job(f"sdxl-{controlnet}-img2img-ip-refined", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     refiner=DEFAULT_SDXL_REFINER,
                     strength=0.8,
@@ -463,17 +633,16 @@ def main() -> None:
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                         "visibility": "denoised",
                         "ip_adapter_scale": 0.5
                     }],
                     prompt="A bride and groom on their wedding day",
                     refiner_start=0.85,
                     guidance_scale=6
-                )[0]
+                ))
 
-                invoke(
-                    f"sdxl-{controlnet}-img2img-ip-plus-refined",
+                add_job(f"sdxl-{controlnet}-img2img-ip-plus-refined", ["sdxl-refined"], lambda control, controlnet=controlnet: dict(
                     model=DEFAULT_SDXL_MODEL,
                     refiner=DEFAULT_SDXL_REFINER,
                     strength=0.8,
@@ -483,41 +652,129 @@ def main() -> None:
                             "controlnet": controlnet,
                             "scale": 0.5
                         }],
-                        "image": control,
+                        "image": control[0],
                         "visibility": "denoised",
                         "ip_adapter_scale": 0.5
                     }],
                     prompt="A bride and groom on their wedding day",
                     refiner_start=0.85,
                     guidance_scale=6
-                )[0]
+                ))
+
+        # Dispatch jobs as soon as their predecessors resolve; the pool keeps
+        # up to MAX_WORKERS invocations in flight so HTTP and queue latency
+        # overlap with remote GPU compute.
+        depended_names = set(
+            depend
+            for _, depends, _ in jobs
+            for depend in depends
+        )
+
+        if download_future is not None:
+            download_future.result()
+        prefetch.shutdown(wait=True)
+
+        completed: Dict[str, List[Union[str, Image.Image]]] = {}
+        pending = list(jobs)
+        futures: Dict[Any, List[str]] = {}
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            while pending or futures:
+                ready = [
+                    job for job in pending
+                    if all(depend in completed for depend in job[1])
+                ]
+                # Group ready jobs by model and refiner so the server can
+                # amortize checkpoint loads, chunking each group so a single
+                # model can still fan out across all workers
+                groups: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+                for job in ready:
+                    pending.remove(job)
+                    name, depends, make_kwargs = job
+                    kwargs = make_kwargs(*[completed[depend] for depend in depends])
+                    bucket = kwargs.get("model", CHECKPOINT)
+                    if kwargs.get("refiner", None):
+                        bucket = f"{bucket}+{kwargs['refiner']}"
+                    groups.setdefault(bucket, []).append((name, kwargs))
+                # Dispatch buckets in checkpoint-residency order so same-model
+                # jobs queue contiguously and the server evicts each loaded
+                # checkpoint at most once per wave
+                for bucket in sorted(
+                    groups,
+                    key=lambda bucket: MODEL_ORDER.index(bucket) if bucket in MODEL_ORDER else len(MODEL_ORDER)
+                ):
+                    group = groups[bucket]
+                    chunk_size = math.ceil(len(group) / MAX_WORKERS)
+                    for start in range(0, len(group), chunk_size):
+                        chunk = group[start:start+chunk_size]
+                        futures[executor.submit(invoke_group, chunk)] = [name for name, _ in chunk]
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    names = futures.pop(future)
+                    try:
+                        completed.update(future.result())
+                    except Exception as ex:
+                        logger.error(f"Invocation group {names} failed: {type(ex).__name__}({ex})")
+                        raise
+
+        _writer.shutdown(wait=True)
+        # Surface any save failure now rather than as a missing file later
+        for future in _writer_futures:
+            future.result()
+        # Everything needed for the grid is on disk now; drop whatever the
+        # run accumulated before allocating the canvas
+        gc.collect()
+
+        # Make grid; tiles are written into one pre-allocated array so each
+        # paste is a slice assignment, then captions are drawn in a single
+        # pass over the finished image.
+        import numpy as np
 
-        # Make grid
         total_results = sum([len(arr) for arr in all_results.values()])
-        rows = (total_results // GRID_COLS) + 1
-        cols = total_results % GRID_COLS if total_results < GRID_COLS else GRID_COLS
+        rows = math.ceil(total_results / GRID_COLS)
+        cols = min(total_results, GRID_COLS)
         width = GRID_SIZE * cols
-        height = (GRID_SIZE * rows) + (CAPTION_HEIGHT * rows)
-        grid = Image.new("RGB", (width, height), (255, 255, 255))
-        draw = ImageDraw.Draw(grid)
+        height = (GRID_SIZE + CAPTION_HEIGHT) * rows
+        canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+        captions: List[Tuple[int, int, str]] = []
         row, col = 0, 0
 
         for name in all_results:
-            for i, image in enumerate(all_results[name]):
-                width, height = image.size
-                image = fit_image(image, GRID_SIZE, GRID_SIZE, "contain", "center-center")
-                grid.paste(image, (col * GRID_SIZE, row * (GRID_SIZE + CAPTION_HEIGHT)))
-                draw.text(
-                    (col * GRID_SIZE + 5, row * (GRID_SIZE + CAPTION_HEIGHT) + GRID_SIZE + 2),
-                    split_text(f"\"{name}\", sample {i+1}, {width}×{height}"),
-                    fill=(0,0,0),
-                    font=font
-                )
+            for i, result_path in enumerate(all_results[name]):
+                thumbnail_path = _thumbnail_path(name, i)
+                tile: Optional[Image.Image] = None
+                # Opening only parses the header; the full-resolution
+                # pixels are decoded only when no thumbnail exists
+                with Image.open(result_path) as result:
+                    image_width, image_height = result.size
+                    if not os.path.exists(thumbnail_path):
+                        result.load()
+                        tile = fit_image(result, GRID_SIZE, GRID_SIZE, "contain", "center-center")
+                if tile is None:
+                    tile = Image.open(thumbnail_path)
+                left = col * GRID_SIZE
+                top = row * (GRID_SIZE + CAPTION_HEIGHT)
+                canvas[top:top+GRID_SIZE, left:left+GRID_SIZE] = np.asarray(tile.convert("RGB"))
+                captions.append((
+                    left + 5,
+                    top + GRID_SIZE + 2,
+                    split_text(f"\"{name}\", sample {i+1}, {image_width}×{image_height}")
+                ))
                 col += 1
                 if col >= GRID_COLS:
                     row += 1
                     col = 0
-        
+
+        grid = Image.fromarray(canvas)
+        draw = ImageDraw.Draw(grid)
+        for caption_left, caption_top, caption in captions:
+            draw.multiline_text(
+                (caption_left, caption_top),
+                caption,
+                fill=(0,0,0),
+                font=FONT,
+                spacing=LINE_SPACING
+            )
+
         grid_path = os.path.join(save_dir, "grid.png")
         grid.save(grid_path)
         logger.info(f"Saved grid result at {grid_path}")